@@ -1,7 +1,7 @@
 from fastapi import APIRouter
-import torch
+from fastapi.responses import ORJSONResponse
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 
 # -----------------------------
 # 1️⃣ ML Test
@@ -11,6 +11,9 @@ def ml_test():
     """
     Проверка доступности PyTorch и базовых операций.
     """
+    # Ленивый импорт: torch не загружается в каждый воркер при старте
+    import torch
+    
     try:
         x = torch.tensor([1.0, 2.0, 3.0])
         y = x * 2
@@ -45,3 +48,8 @@ def health_check():
     """
     return {"status": "healthy"}
 
+def setup_endpoints(app):
+    """
+    Подключение служебных эндпоинтов к приложению.
+    """
+    app.include_router(router, prefix="/api/v1")
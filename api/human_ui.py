@@ -2,8 +2,12 @@ from fastapi import FastAPI, Request, Form
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-import redis
-import json
+import orjson
+import time
+
+from bus.connection import redis_client
+from bus.codec import decode_message
+from bus.cognitive_bus import STREAM_MAXLEN
 
 app = FastAPI(title="Nova System Human UI")
 
@@ -11,8 +15,6 @@ app = FastAPI(title="Nova System Human UI")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
-redis_client = redis.Redis(host='localhost', port=6379, decode_responses=True)
-
 @app.get("/", response_class=HTMLResponse)
 async def dashboard(request: Request):
     """Главная панель для человеческой оценки"""
@@ -23,12 +25,13 @@ async def evaluation_page(request: Request):
     """Страница оценки инсайтов"""
     
     # Получение последних решений для оценки
-    messages = redis_client.xread({"cognitive_bus:lumen_decisions": 0}, count=5)
+    messages = await redis_client.xread({"cognitive_bus:lumen_decisions": 0}, count=5)
     insights = []
     
     if messages:
         for stream, message_list in messages:
-            for message_id, message_data in message_list:
+            for message_id, message_fields in message_list:
+                message_data = decode_message(message_fields)
                 insights.append({
                     "request_id": message_data["request_id"],
                     "insight": message_data["insight"],
@@ -54,10 +57,13 @@ async def submit_feedback(
         "request_id": request_id,
         "rating": rating,
         "comments": comments,
-        "timestamp": json.dumps({"$date": {"$numberLong": str(int(time.time() * 1000))}})
+        "timestamp": orjson.dumps({"$date": {"$numberLong": str(int(time.time() * 1000))}})
     }
     
-    redis_client.xadd("cognitive_bus:feedback", feedback_data)
+    await redis_client.xadd(
+        "cognitive_bus:feedback", feedback_data,
+        maxlen=STREAM_MAXLEN, approximate=True
+    )
     
     return {"status": "success", "message": "Feedback submitted successfully"}
 
@@ -65,16 +71,19 @@ async def submit_feedback(
 async def get_stats():
     """Получение статистики системы"""
     try:
-        # Базовая статистика
-        total_requests = redis_client.xlen("cognitive_bus:requests")
-        total_decisions = redis_client.xlen("cognitive_bus:lumen_decisions")
-        total_feedback = redis_client.xlen("cognitive_bus:feedback")
+        # Базовая статистика за один round-trip
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.xlen("cognitive_bus:requests")
+            pipe.xlen("cognitive_bus:lumen_decisions")
+            pipe.xlen("cognitive_bus:feedback")
+            pipe.ping()
+            total_requests, total_decisions, total_feedback, pong = await pipe.execute()
         
         return {
             "total_requests": total_requests,
             "total_decisions": total_decisions,
             "total_feedback": total_feedback,
-            "system_health": "operational"
+            "system_health": "operational" if pong else "degraded"
         }
     except Exception as e:
         return {"error": str(e)}
@@ -1,23 +1,49 @@
 from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi.responses import ORJSONResponse, Response
 from pydantic import BaseModel
+from typing import Dict
 import uuid
-import json
-import redis
+import orjson
 import asyncio
-from datetime import datetime
 import time
+import logging
+from time import time_ns
 
 # Импорт endpoints
 from api.endpoints import setup_endpoints
+from bus.connection import redis_client, redis_pool
+from bus.codec import encode_message, decode_message
+from bus.cognitive_bus import STREAM_MAXLEN, MESSAGES_PUBLISHED, MESSAGES_CONSUMED
+from prometheus_client import make_asgi_app
 
-app = FastAPI(title="Nova System API", version="1.0.0", docs_url="/docs")
+app = FastAPI(
+    title="Nova System API", version="1.0.0", docs_url="/docs",
+    default_response_class=ORJSONResponse
+)
 
-# Подключение к Redis
-redis_client = redis.Redis(host='localhost', port=6379, decode_responses=True)
+LUMEN_DECISIONS_STREAM = "cognitive_bus:lumen_decisions"
+DECISION_TIMEOUT = 10
+
+TRACE_TTL = 3600
+# Трейсы-хеши хранятся под отдельным префиксом: старые строковые trace:{id} не читаются через HGETALL
+TRACE_KEY_PREFIX = "traceh:"
+
+logger = logging.getLogger(__name__)
+
+# Ожидающие решения Lumen: request_id -> Future, который заполняет диспетчер
+pending_decisions: Dict[str, asyncio.Future] = {}
 
 # Регистрация дополнительных эндпоинтов
 setup_endpoints(app)
 
+# Метрики Prometheus из счетчиков процесса, без обращений к Redis
+app.mount("/metrics-prom", make_asgi_app())
+
+def _now_iso():
+    """Текущее время UTC в ISO-формате без построения datetime"""
+    seconds, nanos = divmod(time_ns(), 1_000_000_000)
+    return f"{time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds))}.{nanos // 1000:06d}"
+
 class ThinkRequest(BaseModel):
     user_id: str
     query: str
@@ -34,30 +60,75 @@ class FeedbackRequest(BaseModel):
     rating: int
     comments: str = ""
 
-def wait_for_lumen_decision(request_id, timeout=10):
-    """Ожидание решения от Lumen"""
-    start_time = time.time()
+async def _dispatch_lumen_decisions():
+    """Единый потребитель потока решений Lumen для всего процесса"""
+    last_id = None
     
-    while time.time() - start_time < timeout:
-        messages = redis_client.xread(
-            {"cognitive_bus:lumen_decisions": 0}, 
-            count=10, 
-            block=1000
-        )
-        
-        if messages:
-            for stream, message_list in messages:
-                for message_id, message_data in message_list:
-                    if message_data.get("request_id") == request_id:
-                        return message_data
+    while True:
+        try:
+            if last_id is None:
+                # Начинаем с последней записи потока, чтобы не перечитывать историю
+                latest = await redis_client.xrevrange(LUMEN_DECISIONS_STREAM, count=1)
+                last_id = latest[0][0] if latest else "0-0"
+            
+            messages = await redis_client.xread(
+                {LUMEN_DECISIONS_STREAM: last_id},
+                count=100,
+                block=5000
+            )
+        except Exception as e:
+            logger.exception("Error reading Lumen decisions")
+            await asyncio.sleep(1)
+            continue
         
-    return None
+        for stream, message_list in messages:
+            for message_id, message_data in message_list:
+                last_id = message_id
+                MESSAGES_CONSUMED.labels(LUMEN_DECISIONS_STREAM).inc()
+                future = pending_decisions.pop(message_data.get("request_id"), None)
+                if future is None or future.done():
+                    continue
+                # Битое решение завершает только свой запрос, а не весь диспетчер
+                try:
+                    future.set_result(decode_message(message_data))
+                except Exception as e:
+                    logger.exception("Error decoding Lumen decision %s for request %s",
+                                     message_id, message_data.get("request_id"))
+                    future.set_exception(e)
+
+def _restart_dispatcher_on_failure(task: asyncio.Task):
+    """Перезапуск диспетчера решений, если он завершился с ошибкой"""
+    if task.cancelled():
+        return
+    exception = task.exception()
+    if exception is not None:
+        logger.error("Lumen decision dispatcher stopped, restarting", exc_info=exception)
+        _start_dispatcher()
+
+def _start_dispatcher():
+    app.state.decision_dispatcher = asyncio.create_task(_dispatch_lumen_decisions())
+    app.state.decision_dispatcher.add_done_callback(_restart_dispatcher_on_failure)
+
+@app.on_event("startup")
+async def start_decision_dispatcher():
+    """Запуск фонового диспетчера решений Lumen"""
+    _start_dispatcher()
+
+@app.on_event("shutdown")
+async def stop_decision_dispatcher():
+    """Остановка диспетчера и закрытие соединений с Redis"""
+    app.state.decision_dispatcher.cancel()
+    await redis_pool.disconnect()
 
 @app.post("/api/think", response_model=ThinkResponse)
 async def think_endpoint(request: ThinkRequest, background_tasks: BackgroundTasks):
     """Основной эндпоинт для обработки запросов"""
     
-    request_id = str(uuid.uuid4())
+    request_id = uuid.uuid4().hex
+    
+    # Future регистрируется до публикации, чтобы не пропустить быстрый ответ
+    decision_future = asyncio.get_running_loop().create_future()
+    pending_decisions[request_id] = decision_future
     
     try:
         # Публикация запроса в Cognitive Bus
@@ -67,35 +138,43 @@ async def think_endpoint(request: ThinkRequest, background_tasks: BackgroundTask
             "query": request.query,
             "context": request.context,
             "mode": request.mode,
-            "timestamp": datetime.utcnow().isoformat()
+            "timestamp": _now_iso()
         }
         
-        redis_client.xadd("cognitive_bus:requests", bus_message)
+        await redis_client.xadd(
+            "cognitive_bus:requests", encode_message(bus_message),
+            maxlen=STREAM_MAXLEN, approximate=True
+        )
+        MESSAGES_PUBLISHED.labels("cognitive_bus:requests").inc()
         
         # Ожидание ответа от Lumen
-        lumen_decision = wait_for_lumen_decision(request_id)
-        
-        if lumen_decision:
-            response = {
-                "request_id": request_id,
-                "lumen": {
-                    "insight": lumen_decision["insight"],
-                    "confidence": lumen_decision["confidence"],
-                    "rationale": lumen_decision["rationale"],
-                    "activation_meta": lumen_decision["meta"]
-                },
-                "trace_id": f"trace_{request_id}"
-            }
-            
-            # Сохранение трейса
-            save_trace(request_id, bus_message, lumen_decision)
-            
-            return ThinkResponse(**response)
-        else:
+        try:
+            lumen_decision = await asyncio.wait_for(decision_future, timeout=DECISION_TIMEOUT)
+        except asyncio.TimeoutError:
             raise HTTPException(status_code=408, detail="Timeout waiting for processing")
         
+        response = {
+            "request_id": request_id,
+            "lumen": {
+                "insight": lumen_decision["insight"],
+                "confidence": lumen_decision["confidence"],
+                "rationale": lumen_decision["rationale"],
+                "activation_meta": lumen_decision["meta"]
+            },
+            "trace_id": f"trace_{request_id}"
+        }
+        
+        # Сохранение трейса
+        await save_trace(request_id, bus_message, lumen_decision)
+        
+        return ThinkResponse(**response)
+        
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка обработки запроса: {str(e)}")
+    finally:
+        pending_decisions.pop(request_id, None)
 
 @app.post("/api/feedback")
 async def feedback_endpoint(feedback: FeedbackRequest):
@@ -105,34 +184,50 @@ async def feedback_endpoint(feedback: FeedbackRequest):
             "request_id": feedback.request_id,
             "rating": feedback.rating,
             "comments": feedback.comments,
-            "timestamp": datetime.utcnow().isoformat()
+            "timestamp": _now_iso()
         }
         
-        redis_client.xadd("cognitive_bus:feedback", feedback_data)
+        await redis_client.xadd(
+            "cognitive_bus:feedback", feedback_data,
+            maxlen=STREAM_MAXLEN, approximate=True
+        )
+        MESSAGES_PUBLISHED.labels("cognitive_bus:feedback").inc()
         
         return {"status": "feedback_received", "request_id": feedback.request_id}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка сохранения фидбека: {str(e)}")
 
-def save_trace(request_id, request_data, decision_data):
+async def save_trace(request_id, request_data, decision_data):
     """Сохранение трейса выполнения"""
-    trace_data = {
-        "request_id": request_id,
-        "request": request_data,
-        "decision": decision_data,
-        "timestamp": datetime.utcnow().isoformat()
+    # Поля хранятся уже в JSON, чтобы чтение отдавало их без повторного разбора
+    trace_fields = {
+        "request": orjson.dumps(request_data),
+        "decision": orjson.dumps(decision_data),
+        "timestamp": _now_iso()
     }
     
-    redis_client.set(f"trace:{request_id}", json.dumps(trace_data), ex=3600)
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.hset(f"{TRACE_KEY_PREFIX}{request_id}", mapping=trace_fields)
+        pipe.expire(f"{TRACE_KEY_PREFIX}{request_id}", TRACE_TTL)
+        await pipe.execute()
+
+def _trace_json(request_id, trace_fields):
+    """Сборка JSON трейса из сохраненных полей без их разбора"""
+    return (
+        f'{{"request_id":{orjson.dumps(request_id).decode()},'
+        f'"request":{trace_fields["request"]},'
+        f'"decision":{trace_fields["decision"]},'
+        f'"timestamp":"{trace_fields["timestamp"]}"}}'
+    )
 
 @app.get("/trace/{request_id}")
 async def get_trace(request_id: str):
     """Получение трейса по ID запроса"""
-    trace_data = redis_client.get(f"trace:{request_id}")
+    trace_fields = await redis_client.hgetall(f"{TRACE_KEY_PREFIX}{request_id}")
     
-    if trace_data:
-        return json.loads(trace_data)
+    if trace_fields:
+        return Response(content=_trace_json(request_id, trace_fields), media_type="application/json")
     else:
         raise HTTPException(status_code=404, detail="Trace not found")
 
@@ -146,7 +241,8 @@ async def root():
             "docs": "/docs",
             "health": "/api/v1/health",
             "think": "/api/think",
-            "metrics": "/api/v1/metrics/cores"
+            "metrics": "/api/v1/metrics/cores",
+            "prometheus": "/metrics-prom"
         }
     }
 
@@ -1,3 +1,16 @@
-from .cognitive_bus import CognitiveBus
+from .connection import redis_pool, redis_client, redis_bytes_pool
+from .codec import encode_message, decode_message
+from .cognitive_bus import CognitiveBus, STREAM_MAXLEN
+from .consumer import GroupConsumer, DEAD_LETTER_STREAM
 
-__all__ = ['CognitiveBus']
+__all__ = [
+    'CognitiveBus',
+    'GroupConsumer',
+    'DEAD_LETTER_STREAM',
+    'STREAM_MAXLEN',
+    'redis_pool',
+    'redis_client',
+    'redis_bytes_pool',
+    'encode_message',
+    'decode_message'
+]
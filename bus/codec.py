@@ -0,0 +1,15 @@
+import orjson
+
+def encode_message(message):
+    """Упаковка сообщения шины: поля маршрутизации отдельно, все данные одним JSON-полем"""
+    fields = {"request_id": message["request_id"], "data": orjson.dumps(message)}
+    if "core" in message:
+        fields["core"] = message["core"]
+    return fields
+
+def decode_message(fields):
+    """Распаковка сообщения шины (ключи могут быть str или bytes)"""
+    data = fields.get("data")
+    if data is None:
+        data = fields[b"data"]
+    return orjson.loads(data)
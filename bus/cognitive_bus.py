@@ -1,37 +1,98 @@
-import redis
+import redis.asyncio as aioredis
+from prometheus_client import Counter, Histogram
+import inspect
 import json
+import os
+import socket
+
+from .connection import redis_pool, STREAM_MAXLEN
+from .codec import encode_message, decode_message
+from .consumer import GroupConsumer
+
+# Группа потребителей запросов: позиция чтения хранится в Redis
+REQUESTS_GROUP = "nova_workers"
+
+BUS_STREAMS = (
+    "cognitive_bus:requests",
+    "cognitive_bus:core_results",
+    "cognitive_bus:lumen_decisions",
+    "cognitive_bus:feedback",
+)
+
+# Внутрипроцессные метрики шины, отдаются через prometheus_client
+MESSAGES_PUBLISHED = Counter(
+    "cognitive_bus_messages_published_total",
+    "Messages published to cognitive bus streams",
+    ["stream"]
+)
+MESSAGES_CONSUMED = Counter(
+    "cognitive_bus_messages_consumed_total",
+    "Messages consumed from cognitive bus streams",
+    ["stream"]
+)
+REDIS_CALL_DURATION = Histogram(
+    "cognitive_bus_redis_call_seconds",
+    "Duration of cognitive bus Redis calls",
+    ["operation"]
+)
 
 class CognitiveBus:
-    def __init__(self):
-        self.redis_client = redis.Redis(host='localhost', port=6379, decode_responses=True)
+    def __init__(self, pool=None):
+        self.redis_client = aioredis.Redis(connection_pool=pool or redis_pool)
+
+    async def _publish(self, stream, data):
+        """Публикация сообщения в поток с учетом метрик"""
+        with REDIS_CALL_DURATION.labels("xadd").time():
+            message_id = await self.redis_client.xadd(
+                stream, encode_message(data),
+                maxlen=STREAM_MAXLEN, approximate=True
+            )
+        MESSAGES_PUBLISHED.labels(stream).inc()
+        return message_id
 
-    def publish_request(self, request_data):
+    async def publish_request(self, request_data):
         """Публикация запроса в шину"""
-        return self.redis_client.xadd("cognitive_bus:requests", request_data)
+        return await self._publish("cognitive_bus:requests", request_data)
 
-    def publish_core_result(self, core_result):
+    async def publish_core_result(self, core_result):
         """Публикация результата работы ядра"""
-        return self.redis_client.xadd("cognitive_bus:core_results", core_result)
+        return await self._publish("cognitive_bus:core_results", core_result)
 
-    def publish_lumen_decision(self, decision):
+    async def publish_lumen_decision(self, decision):
         """Публикация решения Lumen"""
-        return self.redis_client.xadd("cognitive_bus:lumen_decisions", decision)
+        return await self._publish("cognitive_bus:lumen_decisions", decision)
 
-    def get_pending_requests(self, count=10):
+    async def get_pending_requests(self, count=10):
         """Получение ожидающих запросов"""
-        return self.redis_client.xread({"cognitive_bus:requests": 0}, count=count)
-
-    def subscribe_to_requests(self, callback):
-        """Подписка на новые запросы (упрощенная версия)"""
-        last_id = '0'
-        while True:
-            messages = self.redis_client.xread(
-                {"cognitive_bus:requests": last_id}, 
-                count=1, 
-                block=5000
-            )
-            if messages:
-                for stream, message_list in messages:
-                    for message_id, message_data in message_list:
-                        callback(message_data)
-                        last_id = message_id
+        return await self.redis_client.xread({"cognitive_bus:requests": 0}, count=count)
+
+    async def subscribe_to_requests(self, callback, consumer_name=None, count=64):
+        """Подписка на новые запросы через группу потребителей"""
+        stream = "cognitive_bus:requests"
+        consumer_name = consumer_name or f"{socket.gethostname()}-{os.getpid()}"
+        
+        async def handle(message_id, message_data):
+            MESSAGES_CONSUMED.labels(stream).inc()
+            result = callback(decode_message(message_data))
+            if inspect.isawaitable(result):
+                await result
+        
+        # Свои неподтвержденные записи дочитываются при старте, упавшие доставляются повторно,
+        # после MAX_DELIVERIES попыток запись уходит в dead-letter поток
+        consumer = GroupConsumer(
+            self.redis_client, stream, REQUESTS_GROUP, consumer_name, handle,
+            count=count, group_start_id="$"
+        )
+        await consumer.run()
+
+    async def trim_streams(self, cutoff_date):
+        """Удаление из потоков шины записей старше cutoff_date"""
+        cutoff_ms = int(cutoff_date.timestamp() * 1000)
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for stream in BUS_STREAMS:
+                pipe.xtrim(stream, minid=f"{cutoff_ms}-0", approximate=True)
+            return await pipe.execute()
+
+    async def close(self):
+        """Закрытие клиента (общий пул остается открытым)"""
+        await self.redis_client.aclose()
@@ -0,0 +1,24 @@
+import redis.asyncio as aioredis
+
+REDIS_URL = "redis://localhost:6379"
+
+# Приблизительный предел длины потоков шины (XADD MAXLEN ~)
+STREAM_MAXLEN = 100000
+
+# Общий пул соединений с Redis для всех модулей процесса
+redis_pool = aioredis.ConnectionPool.from_url(
+    REDIS_URL,
+    max_connections=64,
+    decode_responses=True,
+    health_check_interval=30
+)
+
+redis_client = aioredis.Redis(connection_pool=redis_pool)
+
+# Пул без декодирования ответов для ядер: поля сообщений читаются как bytes
+# и разбираются orjson напрямую, без промежуточной UTF-8 строки
+redis_bytes_pool = aioredis.ConnectionPool.from_url(
+    REDIS_URL,
+    max_connections=32,
+    health_check_interval=30
+)
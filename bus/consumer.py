@@ -0,0 +1,137 @@
+import asyncio
+import logging
+from redis.exceptions import ResponseError
+
+from .connection import STREAM_MAXLEN
+
+logger = logging.getLogger(__name__)
+
+# Поток для сообщений, которые не удалось обработать за MAX_DELIVERIES доставок
+DEAD_LETTER_STREAM = "cognitive_bus:dead_letter"
+MAX_DELIVERIES = 5
+# Неподтвержденные записи, простаивающие дольше этого (мс), забираются повторно
+RECLAIM_IDLE_MS = 30000
+# Как часто (сек) проверять простаивающие записи группы
+RECLAIM_INTERVAL = 30
+
+class GroupConsumer:
+    """Чтение потока через группу потребителей с повторной доставкой и dead-letter"""
+
+    def __init__(self, redis_client, stream, group, consumer_name, handler,
+                 count=10, group_start_id="0"):
+        self.redis_client = redis_client
+        self.stream = stream
+        self.group = group
+        self.consumer_name = consumer_name
+        # handler(message_id, fields) - корутина; запись подтверждается после ее успешного завершения
+        self.handler = handler
+        self.count = count
+        self.group_start_id = group_start_id
+        self._reclaim_cursor = "0-0"
+
+    async def ensure_group(self):
+        """Создание группы потребителей, если ее еще нет"""
+        try:
+            await self.redis_client.xgroup_create(
+                self.stream, self.group, id=self.group_start_id, mkstream=True
+            )
+        except ResponseError as e:
+            # Группа уже создана другим потребителем
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def run(self, should_run=lambda: True):
+        """Сначала дочитываются свои неподтвержденные записи, затем новые;
+        простаивающие записи группы периодически забираются повторно"""
+        loop = asyncio.get_running_loop()
+        cursor = "0"
+        group_ready = False
+        last_reclaim = loop.time()
+
+        while should_run():
+            try:
+                if not group_ready:
+                    await self.ensure_group()
+                    group_ready = True
+
+                if cursor != ">":
+                    entries = await self._read(cursor, block=None)
+                    if not entries:
+                        cursor = ">"
+                        continue
+                    # Курсор всегда сдвигается за прочитанные записи, даже если их обработка упала
+                    cursor = entries[-1][0]
+                elif loop.time() - last_reclaim >= RECLAIM_INTERVAL:
+                    last_reclaim = loop.time()
+                    entries = await self._reclaim()
+                else:
+                    entries = await self._read(">", block=5000)
+
+                for message_id, fields in entries:
+                    await self._process(message_id, fields)
+
+            except Exception:
+                logger.exception("Error reading %s as %s/%s", self.stream, self.group, self.consumer_name)
+                group_ready = False
+                await asyncio.sleep(1)
+
+    async def _read(self, read_id, block):
+        messages = await self.redis_client.xreadgroup(
+            self.group, self.consumer_name,
+            {self.stream: read_id},
+            count=self.count,
+            block=block
+        )
+        return [entry for _, message_list in messages or [] for entry in message_list]
+
+    async def _reclaim(self):
+        """Забрать себе записи группы, которые слишком долго остаются неподтвержденными"""
+        response = await self.redis_client.xautoclaim(
+            self.stream, self.group, self.consumer_name,
+            min_idle_time=RECLAIM_IDLE_MS,
+            start_id=self._reclaim_cursor,
+            count=self.count
+        )
+        self._reclaim_cursor = response[0]
+        return response[1]
+
+    async def _process(self, message_id, fields):
+        """Обработка одной записи; ошибка одной записи не влияет на остальные"""
+        if message_id is None:
+            return
+        if not fields:
+            # Запись уже удалена из потока (MAXLEN/XTRIM): обрабатывать нечего
+            await self.redis_client.xack(self.stream, self.group, message_id)
+            return
+
+        try:
+            await self.handler(message_id, fields)
+            await self.redis_client.xack(self.stream, self.group, message_id)
+        except Exception as e:
+            logger.exception("Error handling %s entry %s", self.stream, message_id)
+            try:
+                if await self._delivery_count(message_id) >= MAX_DELIVERIES:
+                    await self._dead_letter(message_id, fields, e)
+            except Exception:
+                logger.exception("Error dead-lettering %s entry %s", self.stream, message_id)
+
+    async def _delivery_count(self, message_id):
+        pending = await self.redis_client.xpending_range(
+            self.stream, self.group, min=message_id, max=message_id, count=1
+        )
+        return pending[0]["times_delivered"] if pending else 0
+
+    async def _dead_letter(self, message_id, fields, error):
+        """Перенос записи в dead-letter поток и ее подтверждение в исходной группе"""
+        dead_fields = dict(fields)
+        dead_fields.update({
+            "source_stream": self.stream,
+            "source_id": message_id,
+            "error": repr(error)
+        })
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.xadd(DEAD_LETTER_STREAM, dead_fields, maxlen=STREAM_MAXLEN, approximate=True)
+            pipe.xack(self.stream, self.group, message_id)
+            await pipe.execute()
+        logger.error("Moved %s entry %s to %s after %d deliveries",
+                     self.stream, message_id, DEAD_LETTER_STREAM, MAX_DELIVERIES)
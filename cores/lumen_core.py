@@ -1,17 +1,39 @@
-import redis
-import json
+import redis.asyncio as aioredis
+import orjson
 import asyncio
-import numpy as np
-from sentence_transformers import SentenceTransformer
+import os
+import socket
+from functools import lru_cache
 from memory.lumen_mem import LumenMemory
+from bus.connection import redis_bytes_pool
+from bus.codec import encode_message
+from bus.cognitive_bus import STREAM_MAXLEN
+from bus.consumer import GroupConsumer
+from utils.embeddings import get_embedding_manager
+from utils.logger import get_lumen_logger
 from datetime import datetime
 
+CORE_RESULTS_STREAM = "cognitive_bus:core_results"
+LUMEN_GROUP = "lumen"
+# Время жизни неполной пары результатов Nova/Orvyn
+PAIR_TTL = 300
+# Пакетная запись решений: максимум записей и окно ожидания (сек)
+WRITE_BATCH_SIZE = 64
+WRITE_BATCH_WINDOW = 0.02
+
 class LumenCore:
     def __init__(self):
-        self.redis_client = redis.Redis(host='localhost', port=6379, decode_responses=True)
+        self.redis_client = aioredis.Redis(connection_pool=redis_bytes_pool)
         self.memory = LumenMemory()
         self.is_running = False
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.logger = get_lumen_logger()
+        self.consumer_name = f"lumen-{socket.gethostname()}-{os.getpid()}"
+        self.embedding_manager = get_embedding_manager()
+        # Очередь решений для фоновой пакетной записи
+        self._write_q = asyncio.Queue()
+        self._writer_task = None
+        # Кэш скоров выравнивания для повторяющихся пар текстов Nova/Orvyn
+        self._pair_alignment = lru_cache(maxsize=1024)(self._compute_alignment)
         
         # Политики принятия решений
         self.policy_thresholds = {
@@ -24,10 +46,10 @@ class LumenCore:
         """Обработка результатов от Nova и Orvyn"""
         request_id = nova_result["request_id"]
         
-        print(f"Lumen: Синтез результатов для {request_id}")
+        self.logger.debug("Lumen synthesis", request_id=request_id)
         
         # Вычисление метрик
-        alignment_score = self.calculate_alignment_score(nova_result, orvyn_result)
+        alignment_score = await self.calculate_alignment_score(nova_result, orvyn_result)
         conflict_score = self.calculate_conflict_score(nova_result, orvyn_result)
         novelty_score = self.calculate_novelty_score(nova_result, orvyn_result)
         
@@ -63,49 +85,97 @@ class LumenCore:
             "timestamp": datetime.utcnow().isoformat()
         }
         
-        # Сохранение в память Lumen
-        self.memory.store_decision(request_id, decision, nova_result, orvyn_result)
-        
-        # Публикация решения
-        self.redis_client.xadd("cognitive_bus:lumen_decisions", decision)
+        # Публикация и сохранение в память выполняются фоновым писателем пакетами
+        self._write_q.put_nowait((decision, nova_result, orvyn_result))
         
         return decision
 
-    def calculate_alignment_score(self, nova_result, orvyn_result):
+    async def _writer_loop(self):
+        """Фоновая пакетная запись решений в шину и память Lumen"""
+        loop = asyncio.get_running_loop()
+        
+        while self.is_running or not self._write_q.empty():
+            try:
+                batch = [await asyncio.wait_for(self._write_q.get(), timeout=1.0)]
+            except asyncio.TimeoutError:
+                continue
+            
+            # Добор пакета, пока не истекло окно ожидания
+            deadline = loop.time() + WRITE_BATCH_WINDOW
+            while len(batch) < WRITE_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._write_q.get(), timeout=timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            try:
+                await self._flush_decisions(batch)
+            except Exception as e:
+                self.logger.log_error("decision_write_error", f"Error writing {len(batch)} decisions", exception=e)
+
+    async def _flush_decisions(self, batch):
+        """Публикация пакета решений одним pipeline и запись в память одной транзакцией"""
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for decision, _, _ in batch:
+                pipe.xadd(
+                    "cognitive_bus:lumen_decisions", encode_message(decision),
+                    maxlen=STREAM_MAXLEN, approximate=True
+                )
+            await pipe.execute()
+        
+        await asyncio.to_thread(self.memory.store_decisions, batch)
+
+    async def calculate_alignment_score(self, nova_result, orvyn_result):
         """Вычисление скора выравнивания между Nova и Orvyn"""
         try:
             # Эмбеддинги ключевых элементов
             nova_text = " ".join(nova_result["payload"]["candidate_actions"])
             orvyn_text = " ".join([a["snippet"] for a in orvyn_result["payload"]["analogies"]])
             
-            nova_embedding = self.model.encode([nova_text])
-            orvyn_embedding = self.model.encode([orvyn_text])
-            
-            # Косинусная схожесть
-            alignment = np.dot(nova_embedding, orvyn_embedding.T).flatten()[0]
+            # Кэшированное кодирование выполняется в пуле потоков менеджера эмбеддингов
+            loop = asyncio.get_running_loop()
+            alignment = await loop.run_in_executor(
+                self.embedding_manager.executor, self._pair_alignment, nova_text, orvyn_text
+            )
             return float(max(0, min(1, alignment)))  # Нормализация до [0,1]
             
         except Exception as e:
-            print(f"Lumen alignment calculation error: {e}")
+            self.logger.log_error("alignment_error", "Error calculating alignment",
+                                nova_result.get("request_id"), e)
             return 0.5
 
+    def _compute_alignment(self, nova_text, orvyn_text):
+        """Косинусная схожесть двух текстов за один проход энкодера"""
+        embeddings = self.embedding_manager.encode_texts([nova_text, orvyn_text], batch_size=2)
+        # Нулевые строки - fallback энкодера при ошибке: исключение не попадает в lru_cache
+        if not (embeddings[0].any() and embeddings[1].any()):
+            raise ValueError("Embedding model returned fallback zero embeddings")
+        return float(embeddings[0] @ embeddings[1])
+
     def calculate_conflict_score(self, nova_result, orvyn_result):
         """Вычисление скора конфликта (упрощенная версия)"""
         # Анализ противоречий между аналитическим и аналоговым подходами
         nova_actions = nova_result["payload"]["candidate_actions"]
-        orvyn_domains = set(tag for a in orvyn_result["payload"]["analogies"] for tag in a['tags'])
+        orvyn_analogies = orvyn_result["payload"]["analogies"]
         
-        conflict_indicators = 0
-        total_checks = 0
+        # Признаки Orvyn не зависят от действия и вычисляются один раз
+        orvyn_domains = {tag for a in orvyn_analogies for tag in a['tags']}
+        orvyn_text_lower = " ".join(a['snippet'] for a in orvyn_analogies).lower()
+        has_innovation = "innovation" in orvyn_domains
+        has_increase = "increase" in orvyn_text_lower
         
         # Проверка на противоречия между действиями и доменами
+        conflict_indicators = 0
         for action in nova_actions:
             action_lower = action.lower()
-            if "traditional" in action_lower and "innovation" in orvyn_domains:
+            if has_innovation and "traditional" in action_lower:
                 conflict_indicators += 1
-            if "reduce" in action_lower and "increase" in str(orvyn_result).lower():
+            if has_increase and "reduce" in action_lower:
                 conflict_indicators += 1
-            total_checks += 1
+        total_checks = len(nova_actions)
         
         return conflict_indicators / max(total_checks, 1)
 
@@ -151,7 +221,11 @@ class LumenCore:
 
     def _harmony_fusion(self, nova_actions, orvyn_analogies):
         """Гармоничное слияние - сильные общие тезисы"""
-        strongest_analogy = max(orvyn_analogies, key=lambda x: x['similarity'])
+        if not orvyn_analogies:
+            return self._conservative_synthesis(nova_actions, orvyn_analogies)
+        
+        # Orvyn отдает аналогии отсортированными по убыванию схожести
+        strongest_analogy = orvyn_analogies[0]
         
         insight = f"Based on analytical planning and supported by {strongest_analogy['snippet']}, " \
                  f"focus on {nova_actions[0] if nova_actions else 'the identified solution'} " \
@@ -161,7 +235,10 @@ class LumenCore:
 
     def _creative_fusion(self, nova_actions, orvyn_analogies):
         """Креативный синтез - генерация новых гипотез"""
-        diverse_analogies = sorted(orvyn_analogies, key=lambda x: x['similarity'])[:2]  # Более разнообразные
+        if len(orvyn_analogies) < 2:
+            return self._conservative_synthesis(nova_actions, orvyn_analogies)
+        
+        diverse_analogies = orvyn_analogies[:-3:-1]  # Более разнообразные: две наименее схожие
         
         insight = f"Creative synthesis suggests combining {nova_actions[0] if nova_actions else 'analytical approach'} " \
                  f"with insights from {diverse_analogies[0]['snippet']} and {diverse_analogies[1]['snippet']} " \
@@ -190,46 +267,46 @@ class LumenCore:
         confidence = base_confidence + alignment_boost - conflict_penalty
         return float(max(0, min(1, confidence)))
 
+    async def _handle_core_result(self, message_id, message_data):
+        """Сохранение результата ядра в паре и синтез, когда пара собрана"""
+        request_id = message_data[b"request_id"].decode()
+        pair_key = f"pair:{request_id}"
+        
+        # В пару кладется исходный JSON сообщения, без повторной сериализации;
+        # HSET и HLEN идут в MULTI/EXEC, поэтому собранную пару видит только один потребитель
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.hset(pair_key, message_data[b"core"], message_data[b"data"])
+            pipe.hlen(pair_key)
+            pipe.expire(pair_key, PAIR_TTL)
+            _, pair_size, _ = await pipe.execute()
+        
+        if pair_size >= 2:
+            pair = await self.redis_client.hgetall(pair_key)
+            nova_result = pair.get(b"nova")
+            orvyn_result = pair.get(b"orvyn")
+            
+            if nova_result and orvyn_result:
+                await self.process_core_results(orjson.loads(nova_result), orjson.loads(orvyn_result))
+                await self.redis_client.delete(pair_key)
+
     async def start_listening(self):
         """Запуск прослушивания результатов ядер"""
         self.is_running = True
-        print("LumenCore: Запуск прослушивания core_results...")
-        
-        # Кэш для ожидания парных результатов
-        results_cache = {}
+        self.logger.log_system_event("started", "lumen_core", "Lumen core started listening")
+        self._writer_task = asyncio.create_task(self._writer_loop())
         
-        while self.is_running:
-            try:
-                messages = self.redis_client.xread(
-                    {"cognitive_bus:core_results": 0}, 
-                    count=10, 
-                    block=5000
-                )
-                
-                if messages:
-                    for stream, message_list in messages:
-                        for message_id, message_data in message_list:
-                            request_id = message_data["request_id"]
-                            core = message_data["core"]
-                            
-                            # Сохранение в кэш
-                            if request_id not in results_cache:
-                                results_cache[request_id] = {}
-                            results_cache[request_id][core] = message_data
-                            
-                            # Проверка готовности обоих результатов
-                            if len(results_cache[request_id]) == 2:
-                                nova_result = results_cache[request_id].get("nova")
-                                orvyn_result = results_cache[request_id].get("orvyn")
-                                
-                                if nova_result and orvyn_result:
-                                    await self.process_core_results(nova_result, orvyn_result)
-                                    # Удаление обработанного запроса
-                                    del results_cache[request_id]
-                            
-            except Exception as e:
-                print(f"LumenCore ошибка: {e}")
-                await asyncio.sleep(1)
+        # Запись подтверждается только после того, как ее данные сохранены в паре;
+        # упавшие записи доставляются повторно, а после нескольких попыток уходят в dead-letter
+        consumer = GroupConsumer(
+            self.redis_client, CORE_RESULTS_STREAM, LUMEN_GROUP,
+            self.consumer_name, self._handle_core_result
+        )
+        try:
+            await consumer.run(lambda: self.is_running)
+        finally:
+            # Писатель дописывает оставшиеся в очереди решения и завершается
+            self.is_running = False
+            await self._writer_task
 
     def stop(self):
         """Остановка сервиса"""
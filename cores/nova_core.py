@@ -1,20 +1,46 @@
-import redis
+import redis.asyncio as aioredis
 import json
 import asyncio
 import time
+import re
 import numpy as np  # Добавлен импорт numpy
+from typing import List
 from memory.nova_mem import NovaMemory
+from bus.connection import redis_bytes_pool
+from bus.codec import encode_message, decode_message
+from bus.cognitive_bus import STREAM_MAXLEN
 from utils.logger import get_nova_logger
-from utils.embeddings import get_embedding_manager
+from utils.embeddings import get_embedding_manager, normalize_embeddings
 
 class NovaCore:
     def __init__(self):
-        self.redis_client = redis.Redis(host='localhost', port=6379, decode_responses=True)
+        self.redis_client = aioredis.Redis(connection_pool=redis_bytes_pool)
         self.memory = NovaMemory()
         self.is_running = False
         self.logger = get_nova_logger()
         self.embedding_manager = get_embedding_manager()
         
+        # Базовые концепты и их нормализованные эмбеддинги вычисляются один раз
+        self._concepts = ["экономия", "оптимизация", "улучшение", "сокращение", "повышение"]
+        self._concept_embs = normalize_embeddings(self.embedding_manager.encode_texts(self._concepts), inplace=True)
+        
+        # Ключевые слова доменов в порядке приоритета и единый регэксп для поиска за один проход
+        self._domain_keywords = {
+            "water": ["вода", "водный", "расход воды"],
+            "energy": ["энергия", "электричество", "энергосбережение"],
+            "cost": ["стоимость", "бюджет", "расходы"],
+            "productivity": ["продуктивность", "эффективность", "результативность"]
+        }
+        self._domain_by_keyword = {
+            keyword: domain
+            for domain, keywords in self._domain_keywords.items()
+            for keyword in keywords
+        }
+        self._domain_pattern = re.compile(
+            "|".join(re.escape(keyword) for keyword in sorted(self._domain_by_keyword, key=len, reverse=True)),
+            re.IGNORECASE
+        )
+        
         self.logger.log_system_event("initialized", "nova_core", "Nova core initialized successfully")
 
     async def process_request(self, request_data):
@@ -27,7 +53,7 @@ class NovaCore:
         self.logger.log_request(request_id, request_data.get("user_id", "unknown"), query, context, request_data.get("mode", "balanced"))
         
         try:
-            logic_tree = self._build_logic_tree(query, context)
+            logic_tree = await self._build_logic_tree(query, context)
             candidate_actions = self._generate_candidate_actions(query, logic_tree)
             confidence = self._calculate_confidence(query, candidate_actions)
             
@@ -44,7 +70,10 @@ class NovaCore:
             processing_time = time.time() - start_time
             
             self.memory.store_result(request_id, result)
-            self.redis_client.xadd("cognitive_bus:core_results", result)
+            await self.redis_client.xadd(
+                "cognitive_bus:core_results", encode_message(result),
+                maxlen=STREAM_MAXLEN, approximate=True
+            )
             
             self.logger.log_core_processing("nova", request_id, processing_time, 
                                           len(candidate_actions), confidence)
@@ -58,9 +87,9 @@ class NovaCore:
             # Возвращаем заглушку вместо исключения
             return self._create_fallback_result(request_id, query)
 
-    def _build_logic_tree(self, query: str, context: dict) -> dict:
+    async def _build_logic_tree(self, query: str, context: dict) -> dict:
         """Построение дерева логики"""
-        main_concept = self._extract_main_concept(query)
+        main_concept = await self._extract_main_concept(query)
         related_concepts = self._find_related_concepts(main_concept)
         
         logic_tree = {
@@ -81,17 +110,16 @@ class NovaCore:
         
         return logic_tree
 
-    def _extract_main_concept(self, query: str) -> str:
+    async def _extract_main_concept(self, query: str) -> str:
         """Извлечение основного концепта из запроса"""
-        concepts = ["экономия", "оптимизация", "улучшение", "сокращение", "повышение"]
         try:
-            query_embedding = self.embedding_manager.encode_texts([query])[0]
-            concept_embeddings = self.embedding_manager.encode_texts(concepts)
+            query_embedding = await self.embedding_manager.encode_one(query)
             
-            similarities = np.dot(concept_embeddings, query_embedding)
-            best_match_idx = np.argmax(similarities)
+            # Норма запроса не влияет на argmax, поэтому нормализуются только концепты
+            similarities = self._concept_embs @ query_embedding
+            best_match_idx = int(np.argmax(similarities))
             
-            return concepts[best_match_idx]
+            return self._concepts[best_match_idx]
         except:
             return "анализ"  # Fallback
 
@@ -118,16 +146,12 @@ class NovaCore:
 
     def _identify_domain(self, query: str) -> str:
         """Идентификация домена запроса"""
-        domains = {
-            "water": ["вода", "водный", "расход воды"],
-            "energy": ["энергия", "электричество", "энергосбережение"],
-            "cost": ["стоимость", "бюджет", "расходы"],
-            "productivity": ["продуктивность", "эффективность", "результативность"]
+        matched = {
+            self._domain_by_keyword[match.group(0).lower()]
+            for match in self._domain_pattern.finditer(query)
         }
-        
-        query_lower = query.lower()
-        for domain, keywords in domains.items():
-            if any(keyword in query_lower for keyword in keywords):
+        for domain in self._domain_keywords:
+            if domain in matched:
                 return domain
         return "general"
 
@@ -189,18 +213,31 @@ class NovaCore:
         self.is_running = True
         self.logger.log_system_event("started", "nova_core", "Nova core started listening")
         
+        # Последний прочитанный ID: читаем только новые записи потока
+        last_id = None
+        
         while self.is_running:
             try:
-                messages = self.redis_client.xread(
-                    {"cognitive_bus:requests": 0}, 
-                    count=1, 
+                if last_id is None:
+                    latest = await self.redis_client.xrevrange("cognitive_bus:requests", count=1)
+                    last_id = latest[0][0] if latest else "0-0"
+                
+                messages = await self.redis_client.xread(
+                    {"cognitive_bus:requests": last_id}, 
+                    count=10, 
                     block=5000
                 )
                 
                 if messages:
                     for stream, message_list in messages:
                         for message_id, message_data in message_list:
-                            await self.process_request(message_data)
+                            # Позиция сдвигается до обработки: битая запись не перечитывается бесконечно
+                            last_id = message_id
+                            try:
+                                await self.process_request(decode_message(message_data))
+                            except Exception as e:
+                                self.logger.log_error("message_error", f"Error handling request entry {message_id}",
+                                                      exception=e)
                             
             except Exception as e:
                 self.logger.log_error("listening_error", "Error in listening loop", exception=e)
@@ -1,14 +1,15 @@
-import redis
+import redis.asyncio as aioredis
 import json
 import asyncio
 import numpy as np
 from memory.orvyn_mem import OrvynMemory
+from bus.connection import redis_bytes_pool
 from utils.logger import get_orvyn_logger
-from utils.embeddings import get_embedding_manager
+from utils.embeddings import get_embedding_manager, normalize_embeddings
 
 class OrvynCore:
     def __init__(self):
-        self.redis_client = redis.Redis(host='localhost', port=6379, decode_responses=True)
+        self.redis_client = aioredis.Redis(connection_pool=redis_bytes_pool)
         self.memory = OrvynMemory()
         self.is_running = False
         self.logger = get_orvyn_logger()
@@ -22,24 +23,51 @@ class OrvynCore:
             # ... остальной корпус ...
         ]
         
+        # Нормализованная матрица эмбеддингов корпуса (N, D) считается один раз
+        self._corpus_embs = self._load_corpus_embeddings()
+        
         self.logger.log_system_event("initialized", "orvyn_core", 
                                    f"Orvyn core initialized with {len(self.analogy_corpus)} analogies")
 
-    def find_analogies(self, query: str, top_k: int = 3):
+    def _load_corpus_embeddings(self):
+        """Матрица эмбеддингов корпуса: сохраненные берутся из памяти, кодируются только недостающие"""
+        stored_texts, stored_embs = self.memory.load_all_embeddings(self.embedding_manager.embedding_dim)
+        stored = dict(zip(stored_texts, stored_embs))
+        
+        missing = [text for text in self.analogy_corpus if text not in stored]
+        if missing:
+            missing_embs = self.embedding_manager.encode_texts(missing)
+            # Сохраняются только настоящие эмбеддинги, а не нулевой fallback энкодера
+            encoded = [(text, emb) for text, emb in zip(missing, missing_embs) if emb.any()]
+            self.memory.store_corpus_embeddings([text for text, _ in encoded], [emb for _, emb in encoded])
+            stored.update(zip(missing, missing_embs))
+        
+        corpus_embs = np.stack([stored[text] for text in self.analogy_corpus]).astype(np.float32)
+        return np.ascontiguousarray(normalize_embeddings(corpus_embs, inplace=True))
+
+    async def find_analogies(self, query: str, top_k: int = 3):
         """Поиск аналогий с использованием embedding manager"""
         try:
-            results = self.embedding_manager.batch_similarity([query], self.analogy_corpus, top_k)
-            analogies = []
+            query_embedding = await self.embedding_manager.encode_one(query)
+            query_embedding = query_embedding / (np.linalg.norm(query_embedding) + 1e-8)
+            
+            # Косинусная схожесть со всем корпусом одним умножением матрицы на вектор
+            similarities = self._corpus_embs @ query_embedding
+            top_k = min(top_k, len(similarities))
+            top_idx = np.argpartition(-similarities, top_k - 1)[:top_k] if top_k > 0 else []
+            top_idx = sorted(top_idx, key=lambda idx: -similarities[idx])
             
-            for item in results[0]:
+            analogies = []
+            for idx in top_idx:
+                snippet = self.analogy_corpus[idx]
                 analogies.append({
-                    "snippet": item["corpus_text"],
-                    "similarity": item["similarity"],
-                    "tags": self._extract_tags(item["corpus_text"])
+                    "snippet": snippet,
+                    "similarity": float(similarities[idx]),
+                    "tags": self._extract_tags(snippet)
                 })
             
-            self.logger.debug(f"Found {len(analogies)} analogies for query", 
-                            {"query": query, "analogies_count": len(analogies)})
+            self.logger.debug(f"Found {len(analogies)} analogies for query",
+                              query=query, analogies_count=len(analogies))
             return analogies
             
         except Exception as e:
@@ -0,0 +1,30 @@
+import abc
+import sqlite3
+import threading
+import orjson
+
+# Опции orjson для JSON-колонок: numpy-скаляры из скоров сериализуются напрямую
+ORJSON_OPTS = orjson.OPT_SERIALIZE_NUMPY
+
+class SQLiteMemory(abc.ABC):
+    """Основа хранилищ памяти: одно соединение SQLite на весь срок жизни объекта, запись в режиме WAL"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        # Соединение используется из пула потоков, поэтому доступ к нему сериализуется блокировкой
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.executescript(
+            "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; "
+            "PRAGMA temp_store=MEMORY; PRAGMA cache_size=-20000;"
+        )
+        self.init_database()
+
+    @abc.abstractmethod
+    def init_database(self):
+        """Создание таблиц хранилища"""
+
+    def close(self):
+        """Закрытие соединения с базой данных"""
+        with self._lock:
+            self._conn.close()
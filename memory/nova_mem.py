@@ -1,55 +1,46 @@
-import sqlite3
-import json
+import logging
+import orjson
 from datetime import datetime
+from .base import SQLiteMemory, ORJSON_OPTS
 
-class NovaMemory:
+logger = logging.getLogger(__name__)
+
+class NovaMemory(SQLiteMemory):
     def __init__(self, db_path="memory/nova_memory.db"):
-        self.db_path = db_path
-        self.init_database()
+        super().__init__(db_path)
 
     def init_database(self):
         """Инициализация базы данных SQLite"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS nova_memory (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                request_id TEXT UNIQUE,
-                key TEXT,
-                type TEXT,
-                logic_tree TEXT,
-                confidence REAL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                usage_count INTEGER DEFAULT 0,
-                metadata TEXT
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        with self._lock:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS nova_memory (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    request_id TEXT UNIQUE,
+                    key TEXT,
+                    type TEXT,
+                    logic_tree TEXT,
+                    confidence REAL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    usage_count INTEGER DEFAULT 0,
+                    metadata TEXT
+                )
+            ''')
 
     def store_result(self, request_id, result_data):
         """Сохранение результата обработки"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute('''
-                INSERT INTO nova_memory 
-                (request_id, key, type, logic_tree, confidence, metadata)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                request_id,
-                result_data["payload"]["candidate_actions"][0],
-                "rule",
-                json.dumps(result_data["payload"]["logic_tree"]),
-                result_data["payload"]["confidence"],
-                json.dumps({"source": "nova_core"})
-            ))
-            
-            conn.commit()
+            with self._lock:
+                self._conn.execute('''
+                    INSERT INTO nova_memory 
+                    (request_id, key, type, logic_tree, confidence, metadata)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (
+                    request_id,
+                    result_data["payload"]["candidate_actions"][0],
+                    "rule",
+                    orjson.dumps(result_data["payload"]["logic_tree"], option=ORJSON_OPTS),
+                    result_data["payload"]["confidence"],
+                    orjson.dumps({"source": "nova_core"}, option=ORJSON_OPTS)
+                ))
         except Exception as e:
-            print(f"Ошибка сохранения в Nova memory: {e}")
-        finally:
-            conn.close()
+            logger.warning("Ошибка сохранения в Nova memory: %s", e, exc_info=True)
@@ -1,60 +1,112 @@
-import sqlite3
-import json
+import logging
+import orjson
 import numpy as np
 from datetime import datetime
+from .base import SQLiteMemory, ORJSON_OPTS
 
-class OrvynMemory:
+logger = logging.getLogger(__name__)
+
+class OrvynMemory(SQLiteMemory):
     def __init__(self, db_path="memory/orvyn_memory.db"):
-        self.db_path = db_path
-        self.init_database()
+        super().__init__(db_path)
 
     def init_database(self):
         """Инициализация базы данных"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS orvyn_memory (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                request_id TEXT UNIQUE,
-                query_text TEXT,
-                snippet_text TEXT,
-                embedding BLOB,
-                analogies_tags TEXT,
-                context_tags TEXT,
-                similarity_score REAL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                relevance_score REAL DEFAULT 1.0,
-                usage_count INTEGER DEFAULT 0
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        with self._lock:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS orvyn_memory (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    request_id TEXT UNIQUE,
+                    query_text TEXT,
+                    snippet_text TEXT,
+                    embedding BLOB,
+                    analogies_tags TEXT,
+                    context_tags TEXT,
+                    similarity_score REAL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    relevance_score REAL DEFAULT 1.0,
+                    usage_count INTEGER DEFAULT 0
+                )
+            ''')
+            # Эмбеддинги корпуса аналогий по тексту фрагмента (сырой float32 BLOB)
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS corpus_embeddings (
+                    snippet_text TEXT PRIMARY KEY,
+                    embedding BLOB NOT NULL
+                )
+            ''')
 
     def store_result(self, request_id, result_data, query):
         """Сохранение результатов Orvyn"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        analogies = result_data["payload"]["analogies"]
+        rows = [
+            (
+                f"{request_id}_{analogy['snippet'][:10]}",
+                query,
+                analogy['snippet'],
+                orjson.dumps(analogy['tags'], option=ORJSON_OPTS),
+                analogy['similarity'],
+                result_data["payload"]["confidence"]
+            )
+            for analogy in analogies
+        ]
+        
+        try:
+            with self._lock:
+                # Все аналогии запроса пишутся одной транзакцией
+                self._conn.execute("BEGIN")
+                try:
+                    self._conn.executemany('''
+                        INSERT INTO orvyn_memory 
+                        (request_id, query_text, snippet_text, analogies_tags, 
+                         similarity_score, relevance_score)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', rows)
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+        except Exception as e:
+            logger.warning("Ошибка сохранения в Orvyn memory: %s", e, exc_info=True)
+
+    def store_corpus_embeddings(self, texts, embeddings):
+        """Сохранение эмбеддингов фрагментов корпуса одной транзакцией"""
+        rows = [
+            (text, np.asarray(embedding, dtype=np.float32).tobytes())
+            for text, embedding in zip(texts, embeddings)
+        ]
         
         try:
-            for analogy in result_data["payload"]["analogies"]:
-                cursor.execute('''
-                    INSERT INTO orvyn_memory 
-                    (request_id, query_text, snippet_text, analogies_tags, 
-                     similarity_score, relevance_score)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (
-                    f"{request_id}_{analogy['snippet'][:10]}",
-                    query,
-                    analogy['snippet'],
-                    json.dumps(analogy['tags']),
-                    analogy['similarity'],
-                    result_data["payload"]["confidence"]
-                ))
-            
-            conn.commit()
+            with self._lock:
+                self._conn.execute("BEGIN")
+                try:
+                    self._conn.executemany('''
+                        INSERT OR REPLACE INTO corpus_embeddings (snippet_text, embedding)
+                        VALUES (?, ?)
+                    ''', rows)
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
         except Exception as e:
-            print(f"Ошибка сохранения в Orvyn memory: {e}")
-        finally:
-            conn.close()
+            logger.warning("Ошибка сохранения эмбеддингов корпуса в Orvyn memory: %s", e, exc_info=True)
+
+    def load_all_embeddings(self, dim):
+        """Загрузка сохраненных эмбеддингов фрагментов размерности dim: (тексты, матрица float32)"""
+        with self._lock:
+            rows = self._conn.execute('''
+                SELECT snippet_text, embedding
+                FROM corpus_embeddings
+            ''').fetchall()
+            # Эмбеддинги другой размерности остались от прежней модели: удаляются, чтобы их перекодировали
+            stale = [(row[0],) for row in rows if len(row[1]) != dim * 4]
+            if stale:
+                self._conn.executemany("DELETE FROM corpus_embeddings WHERE snippet_text = ?", stale)
+        
+        rows = [row for row in rows if len(row[1]) == dim * 4]
+        if not rows:
+            return [], np.empty((0, dim), dtype=np.float32)
+        
+        texts = [row[0] for row in rows]
+        embeddings = np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+        return texts, embeddings
@@ -1,9 +1,16 @@
 # run.py
+import os
+
+# ограничиваем фоновые пулы потоков torch/BLAS, чтобы они не конкурировали с воркерами uvicorn
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("MKL_NUM_THREADS", "1")
+
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from api.endpoints import router  # импортируем router из endpoints.py
 
 # создаём объект FastAPI
-app = FastAPI(title="Nova DeepSeek Project")
+app = FastAPI(title="Nova DeepSeek Project", default_response_class=ORJSONResponse)
 
 # подключаем маршруты
 app.include_router(router)
@@ -4,7 +4,7 @@
 """
 
 import asyncio
-import requests
+import aiohttp
 import json
 import time
 import sys
@@ -22,6 +22,64 @@ from utils.logger import setup_logging, get_system_logger
 setup_logging()
 logger = get_system_logger()
 
+# Ожидаемая относительная стоимость обработки запроса по режиму
+MODE_COST = {"creative": 2, "balanced": 1, "analytic": 0}
+
+async def run_test_case(session, i, test_data):
+    """Отправка одного тестового запроса"""
+    try:
+        start_time = time.time()
+        async with session.post("http://localhost:8000/api/think", json=test_data) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                print(f"❌ Ошибка API для запроса {i}: {response.status} - {error_text}")
+                return {
+                    "test_case": i, 
+                    "success": False,
+                    "error": error_text
+                }
+            result = await response.json()
+        
+        processing_time = time.time() - start_time
+        
+        print(f"\n📝 Тестовый запрос {i}: {test_data['query']}")
+        print(f"✅ Успешный ответ за {processing_time:.2f}с:")
+        print(f"   Insight: {result['lumen']['insight']}")
+        print(f"   Confidence: {result['lumen']['confidence']:.2f}")
+        print(f"   Strategy: {result['lumen']['activation_meta']['strategy']}")
+        
+        return {
+            "test_case": i,
+            "success": True,
+            "request_id": result["request_id"],
+            "processing_time": processing_time,
+            "confidence": result['lumen']['confidence'],
+            "strategy": result['lumen']['activation_meta']['strategy']
+        }
+        
+    except Exception as e:
+        print(f"❌ Ошибка при запросе {i}: {e}")
+        return {
+            "test_case": i,
+            "success": False, 
+            "error": str(e)
+        }
+
+async def submit_feedback(session, request_id):
+    """Симуляция человеческого фидбека по ответу"""
+    feedback_data = {
+        "request_id": request_id,
+        "rating": 4,
+        "comments": "Полезный инсайт с практическими рекомендациями"
+    }
+    
+    try:
+        async with session.post("http://localhost:8000/api/feedback", json=feedback_data) as feedback_resp:
+            if feedback_resp.status == 200:
+                print("   📝 Feedback submitted successfully")
+    except Exception as e:
+        print(f"❌ Ошибка при отправке фидбека: {e}")
+
 async def run_full_system_test():
     """Тест полной системы с тремя ядрами"""
     logger.log_system_event("test_start", "test_suite", "Starting full system test")
@@ -62,69 +120,38 @@ async def run_full_system_test():
         }
     ]
     
-    results = []
-    
-    for i, test_data in enumerate(test_cases, 1):
-        print(f"\n📝 Тестовый запрос {i}: {test_data['query']}")
+    # Все запросы отправляются одновременно через одну клиентскую сессию
+    loop = asyncio.get_running_loop()
+    batch_start = loop.time()
+    # Ограниченный пул keep-alive соединений: запросы и фидбек переиспользуют сокеты
+    connector = aiohttp.TCPConnector(limit=8, limit_per_host=8, keepalive_timeout=30)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=15)) as session:
+        # Самые дорогие запросы отправляются первыми (LPT), номера кейсов сохраняются;
+        # задачи создаются явно, чтобы порядок запуска не зависел от as_completed
+        schedule = sorted(
+            enumerate(test_cases, 1),
+            key=lambda case: MODE_COST.get(case[1]["mode"], 1),
+            reverse=True
+        )
+        pending = [
+            asyncio.create_task(run_test_case(session, i, test_data))
+            for i, test_data in schedule
+        ]
         
-        try:
-            start_time = time.time()
-            response = requests.post(
-                "http://localhost:8000/api/think",
-                json=test_data,
-                timeout=15
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                processing_time = time.time() - start_time
-                
-                print(f"✅ Успешный ответ за {processing_time:.2f}с:")
-                print(f"   Insight: {result['lumen']['insight']}")
-                print(f"   Confidence: {result['lumen']['confidence']:.2f}")
-                print(f"   Strategy: {result['lumen']['activation_meta']['strategy']}")
-                
-                results.append({
-                    "test_case": i,
-                    "success": True,
-                    "processing_time": processing_time,
-                    "confidence": result['lumen']['confidence'],
-                    "strategy": result['lumen']['activation_meta']['strategy']
-                })
-                
-                # Симуляция человеческого фидбека
-                if i == 1:
-                    feedback_data = {
-                        "request_id": result["request_id"],
-                        "rating": 4,
-                        "comments": "Полезный инсайт с практическими рекомендациями"
-                    }
-                    
-                    feedback_resp = requests.post(
-                        "http://localhost:8000/api/feedback",
-                        json=feedback_data
-                    )
-                    
-                    if feedback_resp.status_code == 200:
-                        print("   📝 Feedback submitted successfully")
-                
-            else:
-                print(f"❌ Ошибка API: {response.status_code} - {response.text}")
-                results.append({
-                    "test_case": i, 
-                    "success": False,
-                    "error": response.text
-                })
-                
-        except Exception as e:
-            print(f"❌ Ошибка при запросе: {e}")
-            results.append({
-                "test_case": i,
-                "success": False, 
-                "error": str(e)
-            })
+        # Результаты обрабатываются по мере готовности: фидбек по первому запросу
+        # уходит сразу, параллельно с еще не завершенными запросами
+        results_by_case = {}
+        feedback_tasks = []
+        for finished in asyncio.as_completed(pending):
+            result = await finished
+            results_by_case[result["test_case"]] = result
+            if result["test_case"] == 1 and result["success"]:
+                feedback_tasks.append(asyncio.create_task(submit_feedback(session, result["request_id"])))
         
-        await asyncio.sleep(2)
+        await asyncio.gather(*feedback_tasks)
+        results = [results_by_case[i] for i in sorted(results_by_case)]
+    batch_time = loop.time() - batch_start
+    print(f"\n⏱  Все запросы обработаны за {batch_time:.2f}с")
     
     # Статистика тестирования
     print(f"\n📊 Результаты тестирования:")
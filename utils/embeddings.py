@@ -1,41 +1,75 @@
+import os
+import asyncio
+import threading
 import numpy as np
+import torch
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from collections import OrderedDict
 from sentence_transformers import SentenceTransformer
 import faiss
 import json
-import pickle
 from typing import List, Dict, Any, Union, Optional
 import logging
 from pathlib import Path
 
+# Максимум эмбеддингов отдельных предложений в LRU-кэше менеджера
+EMBEDDING_CACHE_SIZE = 100_000
+# Начиная с этого размера индекс строится приближенным (IVF + PQ) вместо точного перебора
+IVF_INDEX_THRESHOLD = 1_000_000
+# Выше этого размера EmbeddingStore строит собственный FAISS-индекс (create_index) и ищет через него, а не перебором
+EXACT_SEARCH_LIMIT = 100_000
+# Динамический батчинг одиночных запросов: максимум текстов и окно ожидания (сек)
+DYNAMIC_BATCH_SIZE = 64
+DYNAMIC_BATCH_WINDOW = 0.005
+
 class EmbeddingManager:
     def __init__(self, model_name: str = 'all-MiniLM-L6-v2', cache_dir: str = "cache/embeddings"):
         self.model_name = model_name
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(parents=True, exist_ok=True)
         
+        # Один поток torch на кодирование: параллелизм дают потоки пула, а не intra-op потоки
+        torch.set_num_threads(1)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass  # Уже задано или параллельная работа torch уже запущена
+        self.executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="encode")
+        # Быстрый токенизатор HF не потокобезопасен ("Already borrowed"): model.encode вызывается под блокировкой
+        self._encode_lock = threading.Lock()
+        
         self.model = self._load_model()
         self.embedding_dim = self.model.get_sentence_embedding_dimension()
+        self.batcher = DynamicBatcher(self)
         
-        self.embedding_cache = {}
+        # LRU-кэш эмбеддингов по (текст, normalize); encode_texts вызывается из пула потоков
+        self.embedding_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
         self.faiss_index = None
+        self._gpu_resources = None  # Создаются при первом переносе индекса на GPU
         self.indexed_texts = []  # Добавлено отсутствующее поле
         
         logging.info(f"EmbeddingManager initialized with model: {model_name}, dim: {self.embedding_dim}")
 
     def _load_model(self):
         """Загрузка модели с кэшированием"""
-        model_cache_file = self.cache_dir / f"{self.model_name.replace('/', '_')}.pkl"
+        # Модель хранится в родном формате sentence-transformers (конфиг + веса в safetensors),
+        # а не pickle: веса отображаются в память при загрузке, без исполнения произвольного кода
+        model_cache_dir = self.cache_dir / self.model_name.replace('/', '_')
         
         try:
-            if model_cache_file.exists():
-                with open(model_cache_file, 'rb') as f:
-                    model = pickle.load(f)
-                logging.info(f"Model loaded from cache: {model_cache_file}")
+            if (model_cache_dir / "modules.json").exists():
+                model = SentenceTransformer(str(model_cache_dir))
+                logging.info(f"Model loaded from cache: {model_cache_dir}")
             else:
                 model = SentenceTransformer(self.model_name)
-                with open(model_cache_file, 'wb') as f:
-                    pickle.dump(model, f)
-                logging.info(f"Model downloaded and cached: {model_cache_file}")
+                model.save(str(model_cache_dir))
+                logging.info(f"Model downloaded and cached: {model_cache_dir}")
+            
+            # На GPU веса и активации в FP16: вдвое меньше памяти и быстрее матричные операции
+            if torch.cuda.is_available():
+                model = model.to("cuda").half()
             
             return model
         except Exception as e:
@@ -43,47 +77,231 @@ class EmbeddingManager:
             return SentenceTransformer('all-MiniLM-L6-v2')
 
     def encode_texts(self, texts: List[str], batch_size: int = 32, 
-                    normalize: bool = True, cache_key: Optional[str] = None) -> np.ndarray:
+                    normalize: bool = True) -> np.ndarray:
         if not texts:
             return np.array([])
         
-        if cache_key and cache_key in self.embedding_cache:
-            return self.embedding_cache[cache_key]
+        embeddings = np.empty((len(texts), self.embedding_dim), dtype=np.float32)
+        
+        # Позиции каждого уникального текста, которого нет в кэше
+        missing = {}
+        with self._cache_lock:
+            for i, text in enumerate(texts):
+                cached = self.embedding_cache.get((text, normalize))
+                if cached is None:
+                    missing.setdefault(text, []).append(i)
+                else:
+                    self.embedding_cache.move_to_end((text, normalize))
+                    embeddings[i] = cached
+        
+        if not missing:
+            return embeddings
         
         try:
-            embeddings = self.model.encode(
-                texts,
-                batch_size=batch_size,
-                show_progress_bar=False,
-                convert_to_numpy=True,
-                normalize_embeddings=normalize
-            )
+            # encode сам сортирует тексты по длине перед разбиением на батчи
+            # и возвращает эмбеддинги в исходном порядке
+            with self._encode_lock:
+                encoded = self.model.encode(
+                    list(missing),
+                    batch_size=batch_size,
+                    show_progress_bar=False,
+                    convert_to_numpy=True,
+                    normalize_embeddings=normalize
+                ).astype(np.float32, copy=False)
             
-            if cache_key:
-                self.embedding_cache[cache_key] = embeddings
+            with self._cache_lock:
+                for (text, positions), embedding in zip(missing.items(), encoded):
+                    embeddings[positions] = embedding
+                    self.embedding_cache[(text, normalize)] = embedding.copy()
+                while len(self.embedding_cache) > EMBEDDING_CACHE_SIZE:
+                    self.embedding_cache.popitem(last=False)
                 
             return embeddings
             
-        except Exception as e:
-            logging.error(f"Error encoding texts: {e}")
-            return np.random.randn(len(texts), self.embedding_dim).astype(np.float32)
+        except Exception:
+            # Нулевые векторы вместо случайных: дешевле и не дают ложной схожести
+            logging.exception("Error encoding %d texts, returning zero embeddings", len(missing))
+            embeddings[[i for positions in missing.values() for i in positions]] = 0.0
+            return embeddings
+
+    async def encode_texts_async(self, texts: List[str], **kwargs) -> np.ndarray:
+        """Кодирование текстов в пуле потоков, не блокируя event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(self.encode_texts, texts, **kwargs))
+
+    async def encode_one(self, text: str) -> np.ndarray:
+        """Кодирование одного текста в общем батче с другими конкурентными запросами"""
+        return await self.batcher.encode_one(text)
+
+    def build_index(self, texts: List[str], embeddings: np.ndarray, use_gpu: bool = True,
+                    quantize: bool = False):
+        """Построение собственного FAISS-индекса менеджера для search_batch"""
+        self.faiss_index = self.create_index(embeddings, use_gpu=use_gpu, quantize=quantize)
+        self.indexed_texts = list(texts)
+
+    def create_index(self, embeddings: np.ndarray, use_gpu: bool = True, quantize: bool = False):
+        """Новый FAISS-индекс по скалярному произведению (на GPU, если он есть); состояние менеджера не меняется"""
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        
+        quantize_flat = quantize and len(embeddings) < IVF_INDEX_THRESHOLD
+        
+        if len(embeddings) >= IVF_INDEX_THRESHOLD:
+            index = faiss.index_factory(self.embedding_dim, "IVF1024,PQ64", faiss.METRIC_INNER_PRODUCT)
+            index.train(embeddings)
+        elif quantize_flat:
+            # Точный перебор по 8-битным кодам: в 4 раза меньше памяти, чем float32
+            index = faiss.IndexScalarQuantizer(
+                self.embedding_dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+            )
+            index.train(embeddings)
+        else:
+            index = faiss.IndexFlatIP(self.embedding_dim)
+        index.add(embeddings)
+        
+        # Плоский IndexScalarQuantizer не переносится на GPU (index_cpu_to_gpu его не поддерживает)
+        if use_gpu and not quantize_flat and faiss.get_num_gpus() > 0:
+            if self._gpu_resources is None:
+                self._gpu_resources = faiss.StandardGpuResources()
+            index = faiss.index_cpu_to_gpu(self._gpu_resources, 0, index)
+        
+        return index
+
+    def search_batch(self, queries: np.ndarray, k: int = 5):
+        """Поиск k ближайших для всех запросов одним вызовом индекса"""
+        if self.faiss_index is None:
+            raise RuntimeError("FAISS index is not built")
+        return search_index(self.faiss_index, self.indexed_texts, queries, k)
 
     # ... остальные методы остаются без изменений ...
 
+class DynamicBatcher:
+    """Объединение одиночных запросов конкурентных вызывающих в общие батчи кодирования"""
+    
+    def __init__(self, manager: EmbeddingManager, max_batch: int = DYNAMIC_BATCH_SIZE,
+                 max_latency: float = DYNAMIC_BATCH_WINDOW):
+        self.manager = manager
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self._queue = None
+        self._task = None
+
+    async def encode_one(self, text: str) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._batch_loop())
+        
+        future = loop.create_future()
+        self._queue.put_nowait((text, future))
+        return await future
+
+    async def _batch_loop(self):
+        """Сбор запросов до max_batch штук или до истечения окна и одно кодирование на батч"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_latency
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            try:
+                embeddings = await self.manager.encode_texts_async([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
+
+class EmbeddingStore:
+    """Матрица нормализованных эмбеддингов с top-k поиском по косинусу"""
+    
+    def __init__(self, texts: List[str], embeddings: np.ndarray,
+                 manager: Optional[EmbeddingManager] = None):
+        self.texts = list(texts)
+        # Строки нормализуются один раз, дальше схожесть - одно умножение матриц
+        self.E_norm = np.ascontiguousarray(
+            normalize_embeddings(np.array(embeddings, dtype=np.float32), inplace=True)
+        )
+        
+        # Собственный индекс хранилища: общий индекс менеджера не перезаписывается
+        self._index = None
+        if manager is not None and len(self.texts) > EXACT_SEARCH_LIMIT:
+            self._index = manager.create_index(self.E_norm)
+
+    def topk(self, queries: np.ndarray, k: int = 5):
+        """k ближайших текстов со скорами для каждой строки queries"""
+        queries = normalize_embeddings(np.array(np.atleast_2d(queries), dtype=np.float32), inplace=True)
+        if self._index is not None:
+            return search_index(self._index, self.texts, queries, k)
+        
+        k = min(k, len(self.texts))
+        if k == 0:
+            return [[] for _ in queries]
+        
+        sims = queries @ self.E_norm.T
+        # Отбор k лучших за O(N), сортируются только они
+        top_idx = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        top_sims = np.take_along_axis(sims, top_idx, axis=1)
+        order = np.argsort(-top_sims, axis=1)
+        top_idx = np.take_along_axis(top_idx, order, axis=1)
+        top_sims = np.take_along_axis(top_sims, order, axis=1)
+        
+        return [
+            [(self.texts[idx], float(score)) for idx, score in zip(row_idx, row_sims)]
+            for row_idx, row_sims in zip(top_idx, top_sims)
+        ]
+
+def search_index(index, texts: List[str], queries: np.ndarray, k: int = 5):
+    """Поиск k ближайших в FAISS-индексе одним вызовом; результат - списки (текст, скор)"""
+    queries = np.ascontiguousarray(np.atleast_2d(queries), dtype=np.float32)
+    scores, ids = index.search(queries, min(k, len(texts)))
+    return [
+        [(texts[idx], float(score)) for idx, score in zip(row_ids, row_scores) if idx != -1]
+        for row_ids, row_scores in zip(ids, scores)
+    ]
+
+# Глобальный инстанс менеджера эмбеддингов, общий для всех ядер
+_embedding_manager = None
+
+def get_embedding_manager() -> EmbeddingManager:
+    global _embedding_manager
+    if _embedding_manager is None:
+        _embedding_manager = EmbeddingManager()
+    return _embedding_manager
+
 def cosine_similarity(vec1: np.ndarray, vec2: np.ndarray) -> float:
     """Вычисление косинусной схожести между двумя векторами"""
     try:
-        if np.linalg.norm(vec1) == 0 or np.linalg.norm(vec2) == 0:
+        norm_product = float(vec1 @ vec1) * float(vec2 @ vec2)
+        if norm_product == 0:
             return 0.0
-        return float(np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2)))
+        return float(vec1 @ vec2) / np.sqrt(norm_product)
     except Exception:
         return 0.0
 
-def normalize_embeddings(embeddings: np.ndarray) -> np.ndarray:
-    """Нормализация эмбеддингов к единичной длине"""
+def cosine_similarity_batch(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Матрица косинусных схожестей (N, M) между строками a и b одним умножением матриц"""
+    return normalize_embeddings(a) @ normalize_embeddings(b).T
+
+def normalize_embeddings(embeddings: np.ndarray, inplace: bool = False) -> np.ndarray:
+    """Нормализация эмбеддингов к единичной длине (inplace=True - без копии входной матрицы)"""
     try:
-        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        # Квадраты норм строк без промежуточной матрицы квадратов элементов
+        norms = np.sqrt(np.einsum('ij,ij->i', embeddings, embeddings))[:, None]
         norms[norms == 0] = 1.0  # Избегаем деления на ноль
+        if inplace:
+            embeddings /= norms
+            return embeddings
         return embeddings / norms
     except Exception:
         return embeddings
@@ -1,10 +1,33 @@
 import logging
+import logging.handlers
+import queue
+import atexit
 import sys
-import json
+import time
+from functools import lru_cache
+import orjson
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, Any, Optional
-import traceback
+
+_ORJSON_LOG_OPTS = orjson.OPT_SERIALIZE_NUMPY
+
+# Секундная часть меток времени меняется раз в секунду, поэтому кэшируется
+@lru_cache(maxsize=4)
+def _utc_seconds(seconds: int) -> str:
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds))
+
+@lru_cache(maxsize=4)
+def _local_seconds(seconds: int) -> str:
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(seconds))
+
+class TextFormatter(logging.Formatter):
+    """Текстовый форматтер с кэшированным форматированием времени"""
+    
+    def formatTime(self, record: logging.LogRecord, datefmt: Optional[str] = None) -> str:
+        if datefmt:
+            return super().formatTime(record, datefmt)
+        return f"{_local_seconds(int(record.created))},{int(record.msecs):03d}"
 
 class JSONFormatter(logging.Formatter):
     """Форматтер для логов в JSON формате"""
@@ -12,7 +35,7 @@ class JSONFormatter(logging.Formatter):
     def format(self, record: logging.LogRecord) -> str:
         """Форматирование лог-записи в JSON"""
         log_entry = {
-            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "timestamp": f"{_utc_seconds(int(record.created))}.{int(record.created % 1 * 1e6):06d}Z",
             "level": record.levelname,
             "logger": record.name,
             "module": record.module,
@@ -35,7 +58,74 @@ class JSONFormatter(logging.Formatter):
                 "traceback": self.formatException(record.exc_info)
             }
         
-        return json.dumps(log_entry, ensure_ascii=False)
+        return orjson.dumps(log_entry, default=str, option=_ORJSON_LOG_OPTS).decode()
+
+class ErrorOnlyFilter(logging.Filter):
+    """Пропускает только записи уровня ERROR и выше"""
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.ERROR
+
+# Размер файла лога до ротации и число хранимых архивов
+LOG_MAX_BYTES = 100 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+
+class LocalQueueHandler(logging.handlers.QueueHandler):
+    """Очередь внутри процесса: запись передается слушателю без форматирования"""
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Сообщение фиксируется сразу, а traceback (exc_info) форматируется
+        # только в потоке слушателя при выводе
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+@lru_cache(maxsize=1)
+def _shared_log_pipeline():
+    """Общие для всех CognitiveLogger обработчики и фоновый слушатель их очереди"""
+    
+    # Создание директории для логов
+    log_dir = Path("logs")
+    log_dir.mkdir(exist_ok=True)
+    
+    # Форматтеры
+    detailed_formatter = TextFormatter(
+        '%(asctime)s - %(name)s - %(levelname)s - [%(module)s:%(funcName)s:%(lineno)d] - %(message)s'
+    )
+    json_formatter = JSONFormatter()
+    
+    # Console handler
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(detailed_formatter)
+    
+    # JSON file handler: структурированный лог заменяет отдельный текстовый файл
+    json_handler = logging.handlers.RotatingFileHandler(
+        log_dir / "nova.jsonl", maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+        encoding="utf-8"
+    )
+    json_handler.setLevel(logging.INFO)
+    json_handler.setFormatter(json_formatter)
+    
+    # Error file handler
+    error_handler = logging.handlers.RotatingFileHandler(
+        log_dir / "errors.log", maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+        encoding="utf-8"
+    )
+    error_handler.addFilter(ErrorOnlyFilter())
+    error_handler.setFormatter(detailed_formatter)
+    
+    # Запись в консоль и файлы выполняется фоновым потоком слушателя очереди,
+    # логгеры только кладут запись в очередь
+    log_queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(
+        log_queue, console_handler, json_handler, error_handler,
+        respect_handler_level=True
+    )
+    listener.start()
+    atexit.register(listener.stop)
+    
+    return LocalQueueHandler(log_queue), listener
 
 class CognitiveLogger:
     """Кастомный логгер для когнитивной системы"""
@@ -49,53 +139,16 @@ class CognitiveLogger:
             self._setup_handlers()
     
     def _setup_handlers(self):
-        """Настройка обработчиков логов"""
-        
-        # Создание директории для логов
-        log_dir = Path("logs")
-        log_dir.mkdir(exist_ok=True)
-        
-        # Форматтеры
-        detailed_formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - [%(module)s:%(funcName)s:%(lineno)d] - %(message)s'
-        )
-        json_formatter = JSONFormatter()
-        
-        # Console handler
-        console_handler = logging.StreamHandler(sys.stdout)
-        console_handler.setLevel(logging.INFO)
-        console_handler.setFormatter(detailed_formatter)
-        
-        # File handler (текстовый)
-        file_handler = logging.FileHandler(
-            log_dir / f"nova_system_{datetime.now().strftime('%Y%m%d')}.log"
-        )
-        file_handler.setLevel(logging.DEBUG)
-        file_handler.setFormatter(detailed_formatter)
-        
-        # JSON file handler
-        json_handler = logging.FileHandler(
-            log_dir / f"nova_system_json_{datetime.now().strftime('%Y%m%d')}.log"
-        )
-        json_handler.setLevel(logging.INFO)
-        json_handler.setFormatter(json_formatter)
-        
-        # Error file handler
-        error_handler = logging.FileHandler(
-            log_dir / f"errors_{datetime.now().strftime('%Y%m%d')}.log"
-        )
-        error_handler.setLevel(logging.ERROR)
-        error_handler.setFormatter(detailed_formatter)
-        
-        # Добавление обработчиков
-        self.logger.addHandler(console_handler)
-        self.logger.addHandler(file_handler)
-        self.logger.addHandler(json_handler)
-        self.logger.addHandler(error_handler)
+        """Подключение общих обработчиков логов"""
+        queue_handler, self._listener = _shared_log_pipeline()
+        self.logger.addHandler(queue_handler)
     
     def log_request(self, request_id: str, user_id: str, query: str, 
                    context: Dict[str, Any], mode: str):
         """Логирование входящего запроса"""
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        
         extra_data = {
             "request_id": request_id,
             "user_id": user_id,
@@ -104,11 +157,14 @@ class CognitiveLogger:
             "mode": mode,
             "event_type": "request_received"
         }
-        self.logger.info(f"Request received: {request_id}", extra={'extra_data': extra_data})
+        self.logger.info("Request received: %s", request_id, extra={'extra_data': extra_data})
     
     def log_core_processing(self, core: str, request_id: str, processing_time: float, 
                            result_count: int = None, confidence: float = None):
         """Логирование обработки ядром"""
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        
         extra_data = {
             "core": core,
             "request_id": request_id,
@@ -117,12 +173,15 @@ class CognitiveLogger:
             "confidence": confidence,
             "event_type": "core_processing"
         }
-        self.logger.info(f"{core} processed request: {request_id}", 
+        self.logger.info("%s processed request: %s", core, request_id, 
                         extra={'extra_data': extra_data})
     
     def log_lumen_synthesis(self, request_id: str, strategy: str, alignment_score: float,
                            conflict_score: float, confidence: float, processing_time: float):
         """Логирование синтеза Lumen"""
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        
         extra_data = {
             "request_id": request_id,
             "strategy": strategy,
@@ -132,23 +191,30 @@ class CognitiveLogger:
             "processing_time_ms": round(processing_time * 1000, 2),
             "event_type": "lumen_synthesis"
         }
-        self.logger.info(f"Lumen synthesis completed: {request_id} (strategy: {strategy})", 
+        self.logger.info("Lumen synthesis completed: %s (strategy: %s)", request_id, strategy, 
                         extra={'extra_data': extra_data})
     
     def log_feedback(self, request_id: str, rating: int, comments: str = ""):
         """Логирование фидбека"""
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        
         extra_data = {
             "request_id": request_id,
             "rating": rating,
             "comments": comments,
             "event_type": "feedback_received"
         }
-        self.logger.info(f"Feedback received for {request_id}: rating {rating}", 
+        self.logger.info("Feedback received for %s: rating %s", request_id, rating, 
                         extra={'extra_data': extra_data})
     
     def log_error(self, error_type: str, message: str, request_id: str = None,
-                 exception: Exception = None, context: Dict[str, Any] = None):
+                 exception: Exception = None, context: Dict[str, Any] = None,
+                 exc_info=False):
         """Логирование ошибок"""
+        if not self.logger.isEnabledFor(logging.ERROR):
+            return
+        
         extra_data = {
             "error_type": error_type,
             "request_id": request_id,
@@ -162,35 +228,43 @@ class CognitiveLogger:
                 "message": str(exception)
             }
         
-        self.logger.error(f"{error_type}: {message}", extra={'extra_data': extra_data})
+        self.logger.error("%s: %s", error_type, message, exc_info=exc_info,
+                          extra={'extra_data': extra_data})
     
     def log_system_event(self, event_type: str, component: str, message: str,
                         details: Dict[str, Any] = None):
         """Логирование системных событий"""
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        
         extra_data = {
             "event_type": event_type,
             "component": component,
             "details": details or {},
             "system_event": True
         }
-        self.logger.info(f"System event [{component}]: {message}", 
+        self.logger.info("System event [%s]: %s", component, message, 
                         extra={'extra_data': extra_data})
     
     def log_performance_metric(self, metric_name: str, value: float, 
                               tags: Dict[str, str] = None):
         """Логирование метрик производительности"""
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        
         extra_data = {
             "metric_name": metric_name,
             "value": value,
             "tags": tags or {},
             "event_type": "performance_metric"
         }
-        self.logger.info(f"Performance metric: {metric_name} = {value}", 
+        self.logger.info("Performance metric: %s = %s", metric_name, value, 
                         extra={'extra_data': extra_data})
 
     # Стандартные методы логгера
     def debug(self, msg: str, **kwargs):
-        self.logger.debug(msg, extra={'extra_data': kwargs})
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(msg, extra={'extra_data': kwargs})
     
     def info(self, msg: str, **kwargs):
         self.logger.info(msg, extra={'extra_data': kwargs})
@@ -242,7 +316,7 @@ def setup_logging(log_level: str = "INFO"):
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
         handlers=[
             logging.StreamHandler(sys.stdout),
-            logging.FileHandler(f"logs/system_{datetime.now().strftime('%Y%m%d')}.log")
+            logging.handlers.TimedRotatingFileHandler("logs/system.log", when="midnight", encoding="utf-8")
         ]
     )
 
@@ -254,7 +328,7 @@ def log_exception(logger: CognitiveLogger, exception: Exception,
         message=f"{context}: {str(exception)}",
         request_id=request_id,
         exception=exception,
-        context={"traceback": traceback.format_exc()}
+        exc_info=exception
     )
 
 # Декоратор для логирования выполнения функций